@@ -1,24 +1,18 @@
 '''
-Initialization Module to force lp_settings and lp_logging to load first to ensure globals are populated correctly.
+Initialization Module to force lp_settings and lp_logging to load first so logging is configured as soon as settings are first read.
+The remaining modules are imported on first access.
 '''
 #import logging as _logging
+import importlib
 from legopython import (
-    lp_api,
-    lp_awssession,
-    lp_dbsecrets,
-    lp_dynamodb,
-    lp_general,
     lp_logging,
-    lp_interface,
-    lp_postgresql,
-    lp_s3,
-    lp_secretsmanager,
     lp_settings
 )
 from legopython.__metadata__ import __description__, __license__, __title__, __version__
 
 __all__ = [
     "lp_api",
+    "lp_api_async",
     "lp_awssession",
     "lp_dbsecrets",
     "lp_dynamodb",
@@ -34,4 +28,25 @@ __all__ = [
     "__title__",
     "__version__",
 ]
+
+_SUBMODULES = (
+    "lp_api",
+    "lp_api_async",
+    "lp_awssession",
+    "lp_dbsecrets",
+    "lp_dynamodb",
+    "lp_general",
+    "lp_interface",
+    "lp_postgresql",
+    "lp_s3",
+    "lp_secretsmanager"
+)
+
+
+def __getattr__(name):
+    '''Import legopython submodules the first time they are accessed.'''
+    if name in _SUBMODULES:
+        return importlib.import_module(f'legopython.{name}')
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
 #_logging.getLogger("legopython").addHandler(_logging.NullHandler())
@@ -12,16 +12,22 @@ for env in ["prod", 'test']:
     env_config[env] = {"api_url": "https://www.reddit.com/"}
 
 #If global envirnment setting is exists as an environment to use, create auth handler.
-if lp_settings.ENVIRONMENT in list(env_config.keys()):
+if lp_settings.environment() in list(env_config.keys()):
     auth_handler = lp_api.AuthHandler(
         name="reddit_basic",
         auth_type=lp_api.AuthType.BASIC,
         env_config=env_config,
-        env=lp_settings.ENVIRONMENT
+        env=lp_settings.environment()
     )
     manage_auth = auth_handler.manage_auth
+
+    def _switch_env(setting_key, new_value):
+        '''Point the auth handler at the new environment when the Environment setting changes'''
+        if setting_key == 'Environment' and new_value in env_config:
+            auth_handler.env = new_value
+    lp_settings.on_setting_change(_switch_env)
 else:
-    logger.warning(f'example_api_basic_auth.py will not be able to make calls since {lp_settings.ENVIRONMENT} is not a support environment')
+    logger.warning(f'example_api_basic_auth.py will not be able to make calls since {lp_settings.environment()} is not a support environment')
 
 
 @manage_auth
@@ -1,21 +1,16 @@
-'''Init Module to force lp_settings and lp_logging to load first to ensure globals are populated correctly.'''
+'''Init Module to force lp_settings and lp_logging to load first so logging is configured as soon as settings are first read.
 
+The remaining modules are imported on first access (PEP 562), so "import legopython" does not pay for requests, boto3, etc. until they are used.
+'''
+import importlib
 from legopython import (
-    lp_api,
-    lp_awssession,
-    lp_dbsecrets,
-    lp_dynamodb,
-    lp_general,
     lp_logging,
-    lp_interface,
-    lp_postgresql,
-    lp_s3,
-    lp_secretsmanager,
     lp_settings
 )
 
 __all__ = [
     "lp_api",
+    "lp_api_async",
     "lp_awssession",
     "lp_dbsecrets",
     "lp_dynamodb",
@@ -27,3 +22,10 @@ __all__ = [
     "lp_secretsmanager",
     "lp_settings"
 ]
+
+
+def __getattr__(name):
+    '''Import legopython submodules the first time they are accessed.'''
+    if name in __all__:
+        return importlib.import_module(f'{__name__}.{name}')
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -1,71 +1,135 @@
-#pylint: disable=line-too-long, consider-using-f-string
+#pylint: disable=line-too-long, consider-using-f-string, import-outside-toplevel
 '''
 Handles API calls for other modules.
 APIS to test against https://github.com/toddmotto/public-apis
-'''
 
+requests, asyncio, getpass and base64 are imported where they are used so importing legopython does not pay for them until an API call is made.
+'''
+from __future__ import annotations
 from enum import Enum
-from functools import wraps
-from getpass import getpass
+from functools import lru_cache, wraps
 from pathlib import Path
+from typing import TYPE_CHECKING
 from time import time
 import json
-import base64
-import requests
+import math
+import os
+import tempfile
+import threading
 from legopython.lp_logging import logger
+if TYPE_CHECKING:
+    import requests
+try:
+    import orjson
+except ImportError:
+    orjson = None
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+#4xx statuses that are transient and worth retrying, every 5xx is retried.
+_RETRY_CLIENT_STATUSES = (408, 429)
+_RETRY_STATUSES = frozenset((*_RETRY_CLIENT_STATUSES, *range(500, 600)))
+
+#send_http_call kwargs that apply to sending a request rather than building it.
+_SEND_KWARGS = ('allow_redirects', 'proxies', 'stream', 'verify', 'cert')
+
+
+@lru_cache(maxsize=None)
+def _get_session(http_attempts:int = 1, base_delay:float = 1.0, max_delay:float = 30.0, jitter:float = 0.5) -> requests.Session:
+    '''Return a pooled requests.Session for the retry settings, creating it on first use.
+
+    Sessions are kept so repeated calls to the same host reuse keep-alive connections instead of a new TCP+TLS handshake per call.
+    Retries and backoff run inside urllib3 through the mounted adapter's Retry.
+    '''
+    import requests
+    from requests.adapters import HTTPAdapter
+    from urllib3.util.retry import Retry
+    retry_settings = {
+        'total': http_attempts - 1,
+        'backoff_factor': base_delay,
+        'status_forcelist': _RETRY_STATUSES,
+        'allowed_methods': frozenset(['GET', 'POST', 'PUT', 'DELETE', 'PATCH', 'HEAD', 'OPTIONS']),
+        'respect_retry_after_header': True,
+        'raise_on_status': False
+    }
+    try:
+        retries = Retry(**retry_settings, backoff_max=max_delay, backoff_jitter=jitter)
+    except TypeError: #urllib3 1.x has no per-instance backoff_max or backoff_jitter
+        retries = Retry(**retry_settings)
+    session = requests.Session()
+    adapter = HTTPAdapter(max_retries=retries, pool_connections=10, pool_maxsize=50, pool_block=False)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
 
 
-def print_raw_request(requesttype:str, url: str, **kwargs):
-    """Prints raw http requests to console for troubleshooting purposes.
+def print_raw_request(requesttype:str, url: str, session:requests.Session = None, **kwargs) -> requests.PreparedRequest:
+    """Prints raw http requests to console for troubleshooting purposes and returns the prepared request.
 
     requesttype = HTTP Method, enter one of: delete, get, post, patch, head, put
     url = Address to send the api request
-    **Kwargs accepts params for send_http_call
+    session = requests.Session used to prepare the request, defaults to the module's pooled session
+    **Kwargs accepts the requests.Request params for send_http_call: data, params, headers, cookies, files, auth, hooks, json
     """
-    req = requests.Request(method = requesttype, url = url, **kwargs)
-    req = req.prepare()
-    print('{}\n{}\r\n{}\r\n\r\n{}'.format(
-        '-----------START-----------',
-        req.method + ' ' + req.url,
-        '\r\n'.join('{}: {}'.format(key, value) for key, value in req.headers.items()),
-        req.body,
-    ))
+    import requests
+    session = session or _get_session()
+    req = session.prepare_request(requests.Request(method = requesttype, url = url, **kwargs))
+    headers = '\r\n'.join(f'{key}: {value}' for key, value in req.headers.items())
+    print(f'-----------START-----------\n{req.method} {req.url}\r\n{headers}\r\n\r\n{req.body}')
+    return req
 
 
-def send_http_call(method:str, url:str, print_request:bool = False, timeout:int = 1000, http_attempts:int = 1, **kwargs) -> requests:
-    '''Sends an api call via requests.request(method, url, args) and handles errors and retries
+def send_http_call(method:str, url:str, print_request:bool = False, timeout:int = 1000, http_attempts:int = 1, session:requests.Session = None, base_delay:float = 1.0, max_delay:float = 30.0, jitter:float = 0.5, **kwargs) -> requests.Response:
+    '''Sends an api call via session.request(method, url, args) and handles errors and retries
 
     method = HTTP Method, enter one of: delete, get, post, patch, head, put, 
     url = String Address to send the api request
     Timeout = Time in ms to wait for a response. ex) 500 = 0.5 seconds
-    http_attempts = Whole int number of times to attempt to retry and get a response if the request times out.
+    http_attempts = Whole int number of times to attempt to get a response if the request fails to connect, times out or returns a 5xx/408/429 status.
+    session = requests.Session to send the call with, defaults to the module's pooled session for the retry settings. A supplied session retries per its own adapters.
+    base_delay, max_delay, jitter = Seconds between retries grow as min(max_delay, base_delay * 2**retry + up to jitter seconds), the first retry is immediate. A Retry-After header replaces the backoff. send_http_call_async uses the same formula.
     **Kwargs accepts values for the following dictionary keys: data, params, headers, cookies, files, auth, allow_redirects, proxies, hooks, stream, verify, cert, json 
 
     Request Module Exceptions: https://github.com/kennethreitz/requests/blob/master/requests/exceptions.py
     '''
-    #Print the raw request sent for troubleshooting purposes.
+    import requests
+    session = session or _get_session(http_attempts, base_delay, max_delay, jitter)
+
+    #Print the raw request sent for troubleshooting purposes, then send that same prepared request instead of preparing it twice.
+    prepared_request = None
     if print_request:
-        print_raw_request(method, url, **kwargs)
+        send_kwargs = {key: kwargs.pop(key) for key in _SEND_KWARGS if key in kwargs}
+        prepared_request = print_raw_request(method, url, session = session, **kwargs)
+        environment_settings = session.merge_environment_settings(prepared_request.url, send_kwargs.get('proxies', {}), send_kwargs.get('stream'), send_kwargs.get('verify'), send_kwargs.get('cert'))
+        send_kwargs = {'allow_redirects': send_kwargs.get('allow_redirects', True), **environment_settings}
     
-    #Make an API call as specified, retrying failures and raising exceptions for invalid statuses as specified.
-    for retry in range(http_attempts):
-        try:
-            response = requests.request(method = method, url = url, timeout = timeout, **kwargs)
-            response.raise_for_status()
-        except requests.exceptions.ConnectTimeout:
-            logger.info(f'API Attempt #{retry} Timed out while trying to connect to server.')
-            continue
-        except requests.exceptions.ReadTimeout:
-            logger.info(f'API Attempt #{retry}. Server did not send data in alotted time.')
-            continue
-        except requests.exceptions.HTTPError:
-            logger.debug(f'API Attempt #{retry} returned http code {response.status_code}.')
-            continue
-        except requests.exceptions.RequestException as general_error: #General catch for other errors.
-            raise requests.exceptions.RequestException("Response from {} errored, returned status code {}: {} \n{}".format(response.url, response.status_code, response.reason, response.content)) from general_error
+    #Make an API call as specified, retries happen in the session's adapter. Raise exceptions for invalid statuses.
+    try:
+        if prepared_request is None:
+            response = session.request(method = method, url = url, timeout = timeout, **kwargs)
         else:
-            return response
-    
+            response = session.send(prepared_request, timeout = timeout, **send_kwargs)
+        response.raise_for_status()
+    except requests.exceptions.ConnectTimeout:
+        logger.info(f'API call to {url} timed out while trying to connect to server after {http_attempts} attempt(s).')
+        raise
+    except requests.exceptions.ReadTimeout:
+        logger.info(f'API call to {url}, server did not send data in alotted time after {http_attempts} attempt(s).')
+        raise
+    except requests.exceptions.ConnectionError as connection_error:
+        #With a Retry mounted, urllib3 wraps a read timeout in MaxRetryError and requests raises it as ConnectionError. Raise ReadTimeout as a session without retries would.
+        from urllib3.exceptions import ReadTimeoutError
+        if not isinstance(getattr(connection_error.args[0] if connection_error.args else None, 'reason', None), ReadTimeoutError):
+            raise
+        logger.info(f'API call to {url}, server did not send data in alotted time after {http_attempts} attempt(s).')
+        raise requests.exceptions.ReadTimeout(connection_error.args[0], request = connection_error.request) from connection_error
+    except requests.exceptions.HTTPError:
+        logger.debug(f'API call to {url} returned http code {response.status_code}.')
+        raise
+    return response
+
 
 class AuthType(Enum):
     """Different authentication types supported by the AuthHandler.
@@ -76,14 +140,36 @@ class AuthType(Enum):
     OAUTH2 = 3 #TODO THIS DOES NOT WORK
 
 home_folder = Path.home()/".lp"
+#Created once at import rather than on every credential read/write.
+home_folder.mkdir(exist_ok=True)
+
+#Codecs for the credential cache as (dumps to bytes, loads from bytes, file suffix). orjson writes the same files as json, only faster.
+_CRED_CODECS = {'json': (lambda obj: json.dumps(obj).encode('utf-8'), json.loads, '.json')}
+if orjson is not None:
+    _CRED_CODECS['orjson'] = (orjson.dumps, orjson.loads, '.json')
+if msgpack is not None:
+    _CRED_CODECS['msgpack'] = (msgpack.packb, msgpack.unpackb, '.msgpack')
+
+#LP_CRED_CODEC picks the credential cache codec, defaulting to the fastest installed json codec.
+_cred_codec_name = os.getenv('LP_CRED_CODEC', 'orjson' if orjson is not None else 'json').lower()
+if _cred_codec_name not in _CRED_CODECS:
+    logger.warning(f"LP_CRED_CODEC {_cred_codec_name} is not installed or supported, caching credentials as json. Supported: {list(_CRED_CODECS)}")
+    _cred_codec_name = 'json'
+_cred_dumps, _cred_loads, _cred_suffix = _CRED_CODECS[_cred_codec_name]
 
 class AuthHandler:
     """Handles authentication for APIs."""
-    def __init__(self, name:str, auth_type:AuthType, env_config:list, env:str = 'prod') :
+    def __init__(self, name:str, auth_type:AuthType, env_config:list, env:str = 'prod', session:requests.Session = None) :
+        self._credentials = None
+        self._auth_header_cache = None
+        self._credentials_dirty = False
+        self._credentials_by_path = {}
+        self._lock = threading.RLock()
         self.name = name
         self.auth_type = auth_type
         self.env_config = env_config
         self.env = env
+        self.session = session
         self.credentials = None
 
     @property
@@ -103,6 +189,12 @@ class AuthHandler:
     @auth_type.setter
     def auth_type(self, auth_type:AuthType):
         self._auth_type = auth_type
+        #Resolve the refresh method once rather than branching on auth_type every refresh
+        self._refresh = {
+            AuthType.BASIC: self._refresh_basic,
+            AuthType.JWT_BEARER: self._refresh_jwt,
+            AuthType.OAUTH2: self._refresh_oauth2
+        }[auth_type]
 
     @property
     def env_config(self):
@@ -127,9 +219,23 @@ class AuthHandler:
             logger.warn(f"Environment {env} does not exist as a config")
         else:
             self._env = env
+            self._api_url = self.env_config[env].get("api_url")
+            self._cred_path = home_folder / f"{self._name}-{self._env}{_cred_suffix}"
+            #Find callable token_params once here instead of walking the config on every token refresh
+            token_params = self.env_config[env].get("token_params") or {}
+            self._token_callables = [(base_key, key, value) for base_key, base_value in token_params.items() if isinstance(base_value, dict) for key, value in base_value.items() if callable(value)]
         #if the environment changes we want to eliminate the cached credentials
         self.credentials = None
 
+    @property
+    def session(self):
+        """requests.Session used for token calls, None uses the module's pooled sessions"""
+        return self._session
+
+    @session.setter
+    def session(self, session:requests.Session):
+        self._session = session
+
     @property
     def credentials(self):
         """The active credentials used to authenticate"""
@@ -137,102 +243,152 @@ class AuthHandler:
 
     @credentials.setter
     def credentials(self, credentials):
+        #Only changed credentials need to be written back to disk
+        if credentials is not None and credentials != self._credentials:
+            self._credentials_dirty = True
         self._credentials = credentials
+        self._cache_auth_header(credentials)
+
+    def _cache_auth_header(self, credentials):
+        """Private function storing (expiry, auth_header) so decorated calls can skip get_valid_credentials until expiry"""
+        if credentials is None:
+            self._auth_header_cache = None
+        else:
+            self._auth_header_cache = (credentials.get('expiry') or math.inf, credentials.get('auth_header'))
 
     def _get_cached_credentials(self):
-        """Private function to get credentials stored on disk"""
-        Path(home_folder).mkdir(exist_ok=True)
-        cached_credential_path = Path(home_folder) / f"{self.name}-{self.env}.json"
-        credfile = Path(cached_credential_path)
-        if not credfile.exists():
-            logger.debug("Could not find cached credentials at %s", cached_credential_path)
+        """Private function to get credentials stored on disk, remembered in memory after the first read"""
+        credentials = self._credentials_by_path.get(self._cred_path)
+        if credentials is not None:
+            return credentials
+        try:
+            credentials = _cred_loads(self._cred_path.read_bytes())
+        except FileNotFoundError:
+            logger.debug("Could not find cached credentials at %s", self._cred_path)
             return None
-        return json.loads(credfile.read_text(encoding='utf-8'))
+        self._credentials_by_path[self._cred_path] = credentials
+        return credentials
 
     def _cache_credentials(self):
-        """Private function to store credentials on disk"""
-        Path(home_folder).mkdir(exist_ok=True)
-        cached_credential_path = Path(home_folder) / f"{self.name}-{self.env}.json"
-        credfile = Path(cached_credential_path)
-        credfile.write_text(json.dumps(self.credentials),encoding="utf-8")
+        """Private function to store credentials on disk.
+        Written to a temporary file then swapped in so concurrent readers never see a partial file.
+        """
+        file_descriptor, temp_path = tempfile.mkstemp(dir=home_folder, prefix=f"{self._cred_path.name}.", suffix=".tmp")
+        try:
+            with os.fdopen(file_descriptor, 'wb') as tempfile_handle:
+                tempfile_handle.write(_cred_dumps(self.credentials))
+            os.replace(temp_path, self._cred_path)
+        except BaseException:
+            os.unlink(temp_path)
+            raise
+        self._credentials_by_path[self._cred_path] = self.credentials
 
     def clear_cached_credentials(self):
         """Clears credentials cached on disk and in memory"""
-        Path(home_folder).mkdir(exist_ok=True)
-        cached_credential_path = Path(home_folder) / f"{self.name}-{self.env}.json"
-        cached_credential_path.unlink()
+        self._cred_path.unlink(missing_ok=True)
+        self._credentials_by_path.pop(self._cred_path, None)
         self.credentials = None
 
     def _get_basic_auth_credentials(self):
         """Prompt for basic authentication credentials and return the username and auth string"""
+        from getpass import getpass
+        import base64
         username = input(f"Enter the username for {self.name} {self.env}: ")
         password = getpass(f"Enter the password for {self.name} {self.env}: ")
         return username, base64.b64encode(bytes(f"{username}:{password}",encoding='utf8')).decode('utf-8')
 
     def _request_token(self):
         """
-        Calls a token URL to request a new Java Web Token.
+        Calls a token URL to request a new Java Web Token or oauth2 token, returning the token response.
+        Callable token_params values are called to refresh their value before each request.
         """
-        token_params = self.env_config.get(self.env).get("token_params")
-        for base_key,base_value in token_params.items():
-            if isinstance(base_value,dict):
-                for key,value in base_value.items():
-                    if callable(value):
-                        logger.debug("Config item %s for %s is a function, calling function to update value",key,base_key)
-                        token_params[base_key][key] = value()
-        return send_http_call(method='post', **token_params)
+        #Fill called values into a per-request copy so the config keeps its callables for later refreshes and env changes
+        token_params = {base_key: {**base_value} if isinstance(base_value, dict) else base_value for base_key, base_value in self._env_config[self._env]["token_params"].items()}
+        for base_key, key, value_function in self._token_callables:
+            logger.debug("Config item %s for %s is a function, calling function to update value",key,base_key)
+            token_params[base_key][key] = value_function()
+        return send_http_call(method='post', session=self.session, **token_params).json()
 
 
-    def _request_oauth2_token(self):
-        """
-        Calls to get an oauth2 token using basic auth. #TODO THIS IS NOT WORKING, working on example_api_oauth2.
-        """
-        token_params = self.env_config.get(self.env).get("token_params")
-        for base_key,base_value in token_params.items():
-            if isinstance(base_value,dict):
-                for key,value in base_value.items():
-                    if callable(value):
-                        logger.debug("Config item %s for %s is a function, calling function to update value",key,base_key)
-                        token_params[base_key][key] = value()
-        return send_http_call(method='post', **token_params)
+    def _refresh_basic(self, now:int) -> dict:
+        """Private function prompting for new basic auth credentials"""
+        credentials = {'received': now}
+        credentials["username"], credentials["credstring"] = self._get_basic_auth_credentials()
+        credentials["auth_header"] = f"Basic {credentials['credstring']}"
+        return credentials
+
+    def _refresh_jwt(self, now:int) -> dict:
+        """Private function requesting a new bearer token"""
+        credentials = self._request_token()
+        credentials['expiry'] = now + credentials.get('expires_in',3600)
+        credentials['auth_header'] = f"Bearer {credentials.get('access_token')}"
+        return credentials
 
+    def _refresh_oauth2(self, now:int) -> dict:
+        """Private function requesting a new oauth2 token using basic auth. #TODO THIS DOES NOT WORK"""
+        self._refresh_basic(now)
+        return self._refresh_jwt(now)
+
+    def _credentials_expired(self, now:int) -> bool:
+        """Private function returning True if there are no credentials in memory or they have expired"""
+        credentials = self._credentials
+        return credentials is None or bool(credentials.get('expiry') and credentials.get('expiry',0) <= now)
 
     def get_valid_credentials(self):
         """
         Function that ensures the present authentication values are valid
         and not expired, and if they don't exists it gets some.
+        Thread safe, concurrent callers with expired credentials share one refresh.
         """
         now = int(time())
-        if self.credentials is None:
-            logger.debug("Beginning loading of cached credentials")
-            self.credentials = self._get_cached_credentials()
-        if self.credentials is None or (self.credentials.get('expiry') and self.credentials.get('expiry',0) <= now):
-            logger.debug('Getting new authentication credentials')
-            self.credentials = {}
-            self.credentials['received'] = now
-            if self.auth_type == AuthType.BASIC:
-                self.credentials["username"],self._credentials["credstring"] = self._get_basic_auth_credentials()
-                self.credentials["auth_header"] = f"Basic {self._credentials.get('credstring')}"
-            elif self.auth_type == AuthType.JWT_BEARER:
-                self.credentials = self._request_token()
-                self.credentials['expiry'] = now + self._credentials.get('expires_in',3600)
-                self.credentials['auth_header'] = f"Bearer {self._credentials.get('access_token')}"
-            elif self.auth_type == AuthType.OAUTH2: #TODO THIS DOES NOT WORK
-                self.credentials["username"], self._credentials["credstring"] = self._get_basic_auth_credentials()
-                self.credentials["auth_header"] = f"Basic {self._credentials.get('credstring')}"
-                self.credentials = self._request_oauth2_token()
-                self.credentials['expiry'] = now + self._credentials.get('expires_in',3600)
-                self.credentials['auth_header'] = f"Bearer {self._credentials.get('access_token')}"
-        self._cache_credentials()
-        return self.credentials
+        #Fast path without the lock while the credentials in memory are still valid
+        if not self._credentials_expired(now):
+            return self._credentials
+
+        with self._lock:
+            #Another thread may have refreshed while this one waited on the lock
+            if self._credentials is None:
+                logger.debug("Beginning loading of cached credentials")
+                #Loaded from disk, so not dirty
+                self._credentials = self._get_cached_credentials()
+                self._cache_auth_header(self._credentials)
+            if self._credentials_expired(now):
+                logger.debug('Getting new authentication credentials')
+                #Built by the refresh method so other threads never see partially filled credentials
+                self.credentials = self._refresh(now)
+            if self._credentials_dirty:
+                self._cache_credentials()
+                self._credentials_dirty = False
+            return self._credentials
 
     def manage_auth(self, func):
         """Decorator to handle authentication"""
         @wraps(func)
         def inner(*args,**kwargs):
-            creds = self.get_valid_credentials()
-            kwargs["api_url"] = kwargs.setdefault("api_url",self.env_config.get(self.env).get("api_url"))
-            kwargs["headers"] = kwargs.setdefault("headers",{})
-            kwargs["headers"]["Authorization"] = creds.get("auth_header")
+            #Reuse the auth header built at the last refresh until it expires
+            auth_header_cache = self._auth_header_cache
+            if auth_header_cache is not None and auth_header_cache[0] > time():
+                auth_header = auth_header_cache[1]
+            else:
+                auth_header = self.get_valid_credentials().get("auth_header")
+            kwargs.setdefault("api_url",self._api_url)
+            headers = kwargs.setdefault("headers",{})
+            headers["Authorization"] = auth_header
             return func(*args,**kwargs)
         return inner
+
+    def manage_auth_async(self, func):
+        """Decorator to handle authentication for async functions, refreshing credentials off the event loop"""
+        @wraps(func)
+        async def inner(*args,**kwargs):
+            import asyncio
+            auth_header_cache = self._auth_header_cache
+            if auth_header_cache is not None and auth_header_cache[0] > time():
+                auth_header = auth_header_cache[1]
+            else:
+                auth_header = (await asyncio.get_running_loop().run_in_executor(None, self.get_valid_credentials)).get("auth_header")
+            kwargs.setdefault("api_url",self._api_url)
+            headers = kwargs.setdefault("headers",{})
+            headers["Authorization"] = auth_header
+            return await func(*args,**kwargs)
+        return inner
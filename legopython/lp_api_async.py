@@ -0,0 +1,111 @@
+'''
+Handles concurrent API calls for other modules.
+Mirrors lp_api.send_http_call on top of aiohttp so batches of independent calls run on one event loop instead of one after another.
+'''
+
+import asyncio
+import random
+import weakref
+from email.utils import parsedate_to_datetime
+from time import time
+import aiohttp
+from legopython.lp_api import _RETRY_CLIENT_STATUSES
+from legopython.lp_logging import logger
+
+#One pooled ClientSession per event loop, aiohttp sessions can not be shared across loops.
+_SESSIONS = weakref.WeakKeyDictionary()
+
+
+def _retry_after_seconds(retry_after:str) -> float:
+    '''Convert a Retry-After header (seconds or HTTP date) into seconds to wait, 0 if missing or unparsable.'''
+    if not retry_after:
+        return 0
+    try:
+        return max(0, float(retry_after))
+    except ValueError:
+        pass
+    try:
+        return max(0, parsedate_to_datetime(retry_after).timestamp() - time())
+    except (TypeError, ValueError):
+        return 0
+
+
+def get_session() -> aiohttp.ClientSession:
+    '''Return the pooled aiohttp.ClientSession for the running event loop, creating it on first use.'''
+    loop = asyncio.get_running_loop()
+    session = _SESSIONS.get(loop)
+    if session is None or session.closed:
+        session = aiohttp.ClientSession(connector = aiohttp.TCPConnector(limit=100, limit_per_host=20, ttl_dns_cache=300))
+        _SESSIONS[loop] = session
+    return session
+
+
+async def close_session() -> None:
+    '''Close the pooled aiohttp.ClientSession for the running event loop, if one was opened.'''
+    session = _SESSIONS.pop(asyncio.get_running_loop(), None)
+    if session is not None:
+        await session.close()
+
+
+async def send_http_call_async(method:str, url:str, timeout:int = 1000, http_attempts:int = 1, session:aiohttp.ClientSession = None, base_delay:float = 1.0, max_delay:float = 30.0, jitter:float = 0.5, **kwargs) -> aiohttp.ClientResponse:
+    '''Sends an api call via session.request(method, url, args) and handles errors and retries without blocking the event loop.
+
+    method = HTTP Method, enter one of: delete, get, post, patch, head, put
+    url = String Address to send the api request
+    timeout = Total seconds to wait for a response, passed through the same as send_http_call
+    http_attempts = Whole int number of times to attempt to retry and get a response if the request times out, can not connect or returns a 5xx/408/429 status. The last error is raised if every attempt fails.
+    session = aiohttp.ClientSession to send the call with, defaults to the pooled session for the running event loop.
+    base_delay, max_delay, jitter = Seconds between retries grow as min(max_delay, base_delay * 2**retry + up to jitter seconds), the first retry is immediate. A Retry-After header replaces the backoff. Same as send_http_call.
+    **Kwargs accepts aiohttp request arguments: data, params, headers, cookies, json, auth, allow_redirects, proxy, ssl
+
+    The body is read before returning, so await response.text() / response.json() work after the call.
+    '''
+    session = session or get_session()
+
+    last_error = None
+    for retry in range(http_attempts):
+        retry_after = 0
+        try:
+            async with session.request(method, url, timeout = aiohttp.ClientTimeout(total=timeout), **kwargs) as response:
+                await response.read()
+                response.raise_for_status()
+        except asyncio.TimeoutError as timeout_error:
+            logger.info(f'API Attempt #{retry} Timed out waiting on server.')
+            last_error = timeout_error
+        except aiohttp.ClientResponseError as status_error:
+            logger.debug(f'API Attempt #{retry} returned http code {status_error.status}.')
+            #Client errors other than timeouts and rate limits will fail again, so do not retry them.
+            if status_error.status < 500 and status_error.status not in _RETRY_CLIENT_STATUSES:
+                raise
+            retry_after = _retry_after_seconds((status_error.headers or {}).get('Retry-After'))
+            last_error = status_error
+        except aiohttp.ClientConnectionError as connection_error: #Retried like a timeout, the same as the sync Retry adapter retries connect errors.
+            logger.info(f'API Attempt #{retry} could not connect: {connection_error}')
+            last_error = connection_error
+        except aiohttp.ClientError as general_error: #General catch for other errors.
+            raise aiohttp.ClientError(f"Request to {url} errored: {general_error}") from general_error
+        else:
+            return response
+
+        #Truncated exponential backoff with jitter so retries do not hammer a struggling server, the same formula as urllib3's Retry used by send_http_call.
+        if retry < http_attempts - 1:
+            delay = retry_after or (0 if retry == 0 else min(max_delay, base_delay * (2 ** retry) + random.random() * jitter))
+            logger.debug(f'Waiting {delay:.2f} seconds before API attempt #{retry + 1}.')
+            await asyncio.sleep(delay)
+
+    #Every attempt failed with a retryable error, raise the last one the same as send_http_call does
+    raise last_error
+
+
+def send_http_calls(calls:list, return_exceptions:bool = False) -> list:
+    '''Send a list of independent api calls concurrently from synchronous code, returning responses in the same order.
+
+    calls = list of kwarg dictionaries for send_http_call_async. ex) [{'method':'get', 'url':'https://www.reddit.com/'}]
+    return_exceptions = True returns raised exceptions in place of their response instead of raising the first one.
+    '''
+    async def _gather():
+        try:
+            return await asyncio.gather(*(send_http_call_async(**call) for call in calls), return_exceptions = return_exceptions)
+        finally:
+            await close_session()
+    return asyncio.run(_gather())
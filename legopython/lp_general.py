@@ -1,7 +1,7 @@
 '''A place to store legoPython functions that have general usability across modules, but aren't necessarily specific to any one module'''
 import csv
+import os
 from pathlib import Path
-from distutils.util import strtobool
 from legopython.lp_logging import logger
 
 
@@ -13,7 +13,9 @@ def listdir_path(file:str):
     fpath = Path(file)
     if fpath.is_dir() :
         logger.debug("file is a directory")
-        yield from [ f for f in fpath.iterdir() if f.is_file() ] #[thing-to-output <other for/if/etc statements>]
+        #scandir entries know their type from the directory listing, avoiding a stat per file that Path.is_file() makes.
+        with os.scandir(fpath) as entries:
+            yield from ( Path(entry.path) for entry in entries if entry.is_file() )
     #If file is a file, load just that file into the list
     elif fpath.is_file() :
         logger.debug("file is a single file")
@@ -21,7 +23,17 @@ def listdir_path(file:str):
     #If both is_dir and is_file are false, assume this is a glob (even though it could be a socket/block device/etc)
     else :
         logger.debug("file is neither file or directory, assuming fileglob")
-        yield from [ f for f in Path(fpath.parent).glob(fpath.name) if f.is_file() ]
+        yield from ( f for f in fpath.parent.glob(fpath.name) if f.is_file() )
+
+
+def strtobool(value:str) -> bool:
+    '''Convert a yes/no style string to bool, raising ValueError for anything else. Replaces the deprecated distutils.util.strtobool.'''
+    value = value.lower()
+    if value in ('y', 'yes', 't', 'true', 'on', '1'):
+        return True
+    if value in ('n', 'no', 'f', 'false', 'off', '0'):
+        return False
+    raise ValueError(f'invalid truth value {value!r}')
 
 
 def prompt_user_yesno(question, default='no') :
@@ -72,9 +84,9 @@ def read_1col_csv(filename: str, hasheader:bool = False) -> list:
         with open(filename, newline='', encoding='utf-8') as writer:
             reader = csv.reader(writer)
             if hasheader:
-                reader.pop(0)
-            csv_column = list(reader)
+                next(reader, None)
+            #Single pass over the rows, skipping blank lines.
+            return [row[0] for row in reader if row]
     except OSError:
         print(f'{filename} not found, no data loaded.')
         return []
-    return [item for sublist in csv_column for item in sublist]
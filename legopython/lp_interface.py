@@ -15,22 +15,25 @@ def functname(arg1:{vartype}, arg2:{vartype}, arg3:{vartype}) -> {responsetype}:
     example) functname(arg1,arg2,arg3)
     """
 '''
-import ast
+import functools
+import json
 import time
 import types
 import typing
-import subprocess
 import sys
 from legopython import lp_general, lp_settings
 from legopython.lp_logging import logger
 
 
+class ReturnToMenu(Exception):
+    '''Raised from a menu option to go straight back to support_functions_menu.'''
+
+
+@functools.lru_cache(maxsize=None)
 def list_function_parameters(function: str) -> dict:
-    '''Get a list of parameters and typing hints from an explicit function.'''
-    function_annotations = function.__annotations__
-    if 'return' in function_annotations.keys():
-        function_annotations.pop('return', None)
-    return function_annotations
+    '''Get a list of parameters and typing hints from an explicit function.
+    Returns a new dict, the function's own __annotations__ are left untouched.'''
+    return {key: value for key, value in function.__annotations__.items() if key != 'return'}
 
 
 def prompt_user(question: str) -> str:
@@ -45,11 +48,11 @@ def prompt_user(question: str) -> str:
 def prompt_set_setting():
     '''Prompt user to set a global variable'''
     settings = {
-        1: {'name':'ENVIRONMENT', 'value': lp_settings.ENVIRONMENT},
-        2: {'name':'LOGGER_LEVEL', 'value': lp_settings.LOGGER_LEVEL},
-        3: {'name':'LOG_FILE_ENABLED', 'value': lp_settings.LOG_FILE_ENABLED},
-        4: {'name':'LOG_LOCATION', 'value': lp_settings.LOG_LOCATION},
-        5: {'name':'AWS_REGION', 'value': lp_settings.AWS_REGION}
+        1: {'name':'ENVIRONMENT', 'value': lp_settings.environment()},
+        2: {'name':'LOGGER_LEVEL', 'value': lp_settings.logger_level()},
+        3: {'name':'LOG_FILE_ENABLED', 'value': lp_settings.log_file_enabled()},
+        4: {'name':'LOG_LOCATION', 'value': lp_settings.log_location()},
+        5: {'name':'AWS_REGION', 'value': lp_settings.aws_region()}
     }
 
     #Print settings dict for user to choose from
@@ -60,7 +63,7 @@ def prompt_set_setting():
 
     if user_setting == 0:
         logger.info('Exiting without changing settings.')
-        return support_functions_menu()
+        raise ReturnToMenu
 
     #Prompt user setting - lowercase for standardization of user input
     lp_settings.set_global_setting(setting_name = settings[user_setting]['name'].lower(), new_value = prompt_user(f'Enter new value for {settings[user_setting]["name"]}: ').lower())
@@ -125,6 +128,22 @@ def prompt_user_int(parameter_name:str):
     return user_input
 
 
+def parse_user_literal(user_input:str):
+    '''Parse a list or dict typed by the user, accepting python style single quotes. Returns None if it can not be parsed.
+
+    Tries the C json parser on the input as typed first, only falling back to ast.literal_eval for python-only input such as single quotes or True/None.
+    '''
+    try:
+        return json.loads(user_input)
+    except json.JSONDecodeError:
+        pass
+    import ast
+    try:
+        return ast.literal_eval(user_input)
+    except (ValueError, SyntaxError):
+        return None
+
+
 def prompt_user_list(parameter_name:str):
     '''Prompts user to enter list input, returns list'''
     valid_input = False
@@ -136,9 +155,11 @@ def prompt_user_list(parameter_name:str):
 
         #Parse user input with brackets as list and check for a provided csv.
         if user_input.startswith('[') and user_input.endswith(']'):
-            user_input = ast.literal_eval(user_input)
-            valid_input = True
-        if user_input.endswith('.csv'):
+            parsed_input = parse_user_literal(user_input)
+            if isinstance(parsed_input, list):
+                user_input = parsed_input
+                valid_input = True
+        elif user_input.endswith('.csv'):
             user_input = lp_general.read_1col_csv(user_input, hasheader = False)
             valid_input = True
 
@@ -151,18 +172,30 @@ def prompt_user_dict(parameter_name:str):
     '''Prompts user to enter dict input, returns dict'''
     valid_input = False
     while valid_input is False:
-        user_input = prompt_user(f'f"Enter input for parameter for {parameter_name} in dict format {"key": "value", "key": "value"}')
+        user_input = prompt_user(f'Enter input for parameter for {parameter_name} in dict format {{"key": "value", "key": "value"}}: ')
         #If user chooses to enter nothing, skip.
         if user_input == '':
             valid_input = True
         
         if user_input.startswith('{') and user_input.endswith('}'):
-            user_input = ast.literal_eval(user_input)
-            valid_input = True
-        elif valid_input is not True:
-            print(f'Please enter value for {parameter_name} in dict format {"key": "value", "key": "value"}')
+            parsed_input = parse_user_literal(user_input)
+            if isinstance(parsed_input, dict):
+                user_input = parsed_input
+                valid_input = True
+        if valid_input is not True:
+            print(f'Please enter value for {parameter_name} in dict format {{"key": "value", "key": "value"}}')
     return user_input
 
+#Prompt function for each supported parameter type hint
+_PARAMETER_PROMPTS = {
+    str: prompt_user_string,
+    bool: prompt_user_bool,
+    int: prompt_user_int,
+    list: prompt_user_list,
+    dict: prompt_user_dict,
+    typing.Union[list, str]: prompt_user_list
+}
+
 def prompt_user_parameters(function_name:types.FunctionType, skip_params:list, prompt=True) -> dict:
     '''Prompt user for each parameter of {function_name} for use with support_functions_dict. 
     
@@ -185,33 +218,24 @@ def prompt_user_parameters(function_name:types.FunctionType, skip_params:list, p
     print('(blank=skip // quit/exit returns to menu.)\n')
     for count, parameter in enumerate(parameter_dict):
         if count not in skip_params:
+            parameter_type = parameter_dict[parameter]
 
             #Prompt user for the type listed in the parameter's typehint.
-            if parameter_dict[parameter] == type('string'):
-                user_input = prompt_user_string(parameter)
-            if parameter_dict[parameter] == type(False):
-                user_input = prompt_user_bool(parameter_name=parameter)
-            if parameter_dict[parameter] == type(7):
-                user_input = prompt_user_int(parameter_name=parameter)
-            if parameter_dict[parameter] == type(['str','str','str']):
-                user_input = prompt_user_list(parameter_name=parameter)
-            if parameter_dict[parameter] == type({"key": "value"}):
-                user_input = prompt_user_dict(parameter_name=parameter)
-            if parameter_dict[parameter] == typing.Union[list, str]:
-                user_input = prompt_user_list(parameter_name=parameter)
-
-            try: #If user entered blank, skip. Else, add to kwargs dictionary.
-                if user_input != '':
-                    parameter_input[parameter] = user_input
-            except UnboundLocalError:
-                print(f'{parameter_dict[parameter]} is not a supported type; Exiting.')
+            prompt_function = _PARAMETER_PROMPTS.get(parameter_type)
+            if prompt_function is None:
+                print(f'{parameter_type} is not a supported type; Exiting.')
                 time.sleep(3)
-                return support_functions_menu()
+                raise ReturnToMenu
+            user_input = prompt_function(parameter)
+
+            #If user entered blank, skip. Else, add to kwargs dictionary.
+            if user_input != '':
+                parameter_input[parameter] = user_input
 
     if prompt:
         print(f'\n {parameter_input} \n')
         if not lp_general.prompt_user_yesno(question=f"Are you sure you want to run {function_name.__name__} with the parameters above?"):
-            return support_functions_menu()
+            raise ReturnToMenu
     return parameter_input
 
 
@@ -219,38 +243,42 @@ def support_functions_menu():
     ''' Prints available functions and allows selection of function in support_functions_dict'''
 
     support_functions_dict = {
-        0   : {'name':f'Change Settings    ENV:{lp_settings.ENVIRONMENT}','function':prompt_set_setting,'skip_param':[]},
+        0   : {'name':'Change Settings    ENV:{environment}','function':prompt_set_setting,'skip_param':[]},
         1   : {'name':'Update legopython: pip install','function':'pip install --upgrade legopython -i https://app.jfrog.io/artifactory/api/pypi/home-pypi/simple','skip_param':[]},
         2   : {'name':'Example Internal Application Module','function':'example_api_basic_auth','skip_param':[]}
     }
 
-    #Display menu
-    for key,value in support_functions_dict.items():
-        if key == 0:
-            print(f'\n{key}: {value["name"]}\n')
-        else:
-            print(f'{key}: {value["name"]}')
-    print('\nCtrl + C or type exit to close.')
-
-    user_input = lp_general.prompt_user_int('\nEnter the number for a Support Function ', maximum=(len(support_functions_dict)-1))
-
-    #If user selected a function instead of a string, else call the string via command line.
-    if isinstance(support_functions_dict[user_input]['function'], types.FunctionType):
-        func = support_functions_dict[user_input]['function']
-        skip_params = support_functions_dict[user_input]['skip_param']
-        user_parameters = prompt_user_parameters(func, skip_params)
-        if user_parameters == {}: #if no user parameters entered or if all parameters skip
-            func()
-        else:
-            func(**user_parameters)
-
-        print(f"\nCompleted running function {support_functions_dict[user_input]['function'].__name__}. Returning to main menu.")
-    else:
-        subprocess.call(support_functions_dict[user_input]['function'],shell=True)
-        print(f"\nCompleted running function {support_functions_dict[user_input]['function']}. Returning to main menu.")
-
-    time.sleep(3)
-    return support_functions_menu()
+    while True:
+        #Display menu
+        for key,value in support_functions_dict.items():
+            if key == 0:
+                print(f'\n{key}: {value["name"].format(environment=lp_settings.environment())}\n')
+            else:
+                print(f'{key}: {value["name"]}')
+        print('\nCtrl + C or type exit to close.')
+
+        user_input = lp_general.prompt_user_int('\nEnter the number for a Support Function ', maximum=(len(support_functions_dict)-1))
+
+        #If user selected a function instead of a string, else call the string via command line.
+        try:
+            if isinstance(support_functions_dict[user_input]['function'], types.FunctionType):
+                func = support_functions_dict[user_input]['function']
+                skip_params = support_functions_dict[user_input]['skip_param']
+                user_parameters = prompt_user_parameters(func, skip_params)
+                if user_parameters == {}: #if no user parameters entered or if all parameters skip
+                    func()
+                else:
+                    func(**user_parameters)
+
+                print(f"\nCompleted running function {support_functions_dict[user_input]['function'].__name__}. Returning to main menu.")
+            else:
+                import subprocess
+                subprocess.call(support_functions_dict[user_input]['function'],shell=True)
+                print(f"\nCompleted running function {support_functions_dict[user_input]['function']}. Returning to main menu.")
+        except ReturnToMenu:
+            continue
+
+        time.sleep(3)
 
 
 def main():
@@ -1,7 +1,8 @@
 '''Module Configuring how legoPython logs with global settings in lp_settings.
  https://docs.python.org/3/howto/logging.html
 
-Console prints the lowest level set in lp_settings.LOGGER_LEVEL
+Console prints the lowest level set in the lp_settings Logger_Level setting
+The console handler is added at import. The level and log file are applied when settings are first loaded, by the first lp_settings accessor call or the first legopython log record, so importing legopython does not read settings.ini.
 
 0: NOTSET,
 10: DEBUG
@@ -16,20 +17,53 @@ from legopython import lp_settings
 logger = logging.getLogger("legopython")
 
 
+#Handlers added by this module, kept so setting changes can update them in place.
+_console_handler = None
+_log_file_handler = None
+
+
 def __console_log_handler(level=logger.info):
     '''Add the "default" handler for the moxepython logger at the INFO level
     Pass a different log level in for different screen outputs
     '''
+    global _console_handler
     console_config = logging.StreamHandler(sys.stdout) #push log messages to the console
     console_config.setFormatter(logging.Formatter('%(message)s')) #just show messages, not module or time
     console_config.setLevel(level)
     logger.addHandler(console_config)
+    _console_handler = console_config
 
     if level == logging.DEBUG : #Enable timestamps and showing debug statements if logger set to debug
         logger.handlers[0].setLevel(logging.DEBUG) #We control this logger, and only have 1 handler set
         logger.handlers[0].setFormatter(logging.Formatter('%(levelname)-8s: %(module)s:%(funcName)s: %(message)s'))
 
 
+def __log_file_handler():
+    '''Add the log file handler to the root logger if Log_File_Enabled, replacing one added before'''
+    global _log_file_handler
+    root_logger = logging.getLogger()
+    if _log_file_handler is not None:
+        root_logger.removeHandler(_log_file_handler)
+        _log_file_handler.close()
+        _log_file_handler = None
+    if lp_settings.log_file_enabled() != 'true':
+        return
+    #This controls what logger.{type} is printed and how the log file is formatted.
+    _log_file_handler = logging.FileHandler(f"{lp_settings.log_location()}/log.txt", encoding='utf-8')
+    _log_file_handler.setFormatter(logging.Formatter('%(asctime)s;%(levelname)s;%(message)s', datefmt='%Y-%m-%d %H:%M:%S'))
+    root_logger.addHandler(_log_file_handler)
+    root_logger.setLevel(lp_settings.logger_level().upper())
+
+
+def __apply_setting_change(setting_key:str, new_value:str):
+    '''lp_settings.on_setting_change callback so logging setting changes apply without restarting'''
+    if setting_key == 'Logger_Level':
+        logger.setLevel(new_value.upper())
+        _console_handler.setLevel(new_value.upper())
+    if setting_key in ('Logger_Level', 'Log_File_Enabled', 'Log_Location'):
+        __log_file_handler()
+
+
 def __test_logging():
     print('print message')
     logger.debug('debug message')
@@ -39,16 +73,28 @@ def __test_logging():
     logger.critical('critical message')
 
 
-#Configures how console print outs through std.out'''
-__console_log_handler(lp_settings.LOGGER_LEVEL.upper())
+def __load_settings_on_first_record(record) -> bool:
+    '''Filter on the legopython logger until settings are loaded.
+    The first record forces the load so the level and log file are configured before it is handled, even if the module logging it never reads a setting.'''
+    #Records logged while settings load are checked against the value read so far
+    return record.levelno >= logging.getLevelName(lp_settings.logger_level().upper())
 
-#Configure how the log file is set up if enabled.
-if lp_settings.LOG_FILE_ENABLED:
-    #This controls what logger.{type} is printed and how the log file is formatted.
-    logging.basicConfig(
-        filename = f'{lp_settings.LOG_LOCATION}/log.txt',
-        encoding ='utf-8',
-        level = lp_settings.LOGGER_LEVEL.upper(),
-        format = '%(asctime)s;%(levelname)s;%(message)s',
-        datefmt ='%Y-%m-%d %H:%M:%S'
-        )
+
+def __configure_logging():
+    '''lp_settings.on_settings_load callback, the level and log file are applied once settings.ini is loaded instead of at import'''
+    logger.removeFilter(__load_settings_on_first_record)
+    #The legopython logger gets the level itself, otherwise it inherits the root logger's WARNING and drops info/debug before any handler sees them
+    logger.setLevel(lp_settings.logger_level().upper())
+    _console_handler.setLevel(lp_settings.logger_level().upper())
+
+    #Configure how the log file is set up if enabled.
+    __log_file_handler()
+
+
+#Configures how console print outs through std.out, the handler needs no settings so it is added at import
+__console_log_handler(logging.NOTSET)
+#Until settings load, let every record reach the filter that loads them
+logger.setLevel(logging.DEBUG)
+logger.addFilter(__load_settings_on_first_record)
+lp_settings.on_settings_load(__configure_logging)
+lp_settings.on_setting_change(__apply_setting_change)
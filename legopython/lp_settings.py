@@ -2,44 +2,138 @@
 
 Lego Python supports the following
 
-ENVIRONMENT: MoxeAPI and external module templates point different API endpoints depending on env.
-LOGGER_LEVEL = Controls both console and log file logging levels in lp_logging
-LOG_FILE_ENABLED = Boolean string for creating a log file.
-LOG_LOCATION = Filepath to the log file.
+environment(): MoxeAPI and external module templates point different API endpoints depending on env.
+logger_level() = Controls both console and log file logging levels in lp_logging
+log_file_enabled() = Boolean string for creating a log file.
+log_location() = Filepath to the log file.
+aws_region() = AWS region used by the AWS modules.
+
+Settings are loaded from settings.ini on first use (or its settings.cache.json sidecar while that is newer), read them with the accessors above or get_setting('Environment') (setting key or alias).
+settings_dict is the single source of truth, the 'value' entries below are the defaults used if settings.ini does not exist.
 
 To add a new setting:
-1. create global variable.
-2. add entry into settings_dict (alias must be unique)
-3. add debug printout for new global in def main()
+1. add entry into settings_dict with its default value (alias must be unique)
+2. add an accessor function next to environment()
+3. add debug printout for new setting in _ensure_loaded()
 '''
+import hashlib
+import json
 import os
-import sys
+import re
 import logging
-from configparser import ConfigParser
+import mmap
+import threading
 from pathlib import Path
+try:
+    import orjson
+except ImportError:
+    orjson = None
 logger = logging.getLogger("legopython")
 
-#local globals
-lp_folder = Path.home().joinpath(".lp")
-config_filepath = lp_folder.joinpath("settings.ini")
-pip_credentials_filepath = Path.home().joinpath(".netrc")
-
-#GLOBAL SETTINGS: Initialized values if config file does not exist.
-ENVIRONMENT = 'test'
-LOGGER_LEVEL = 'debug'
-LOG_FILE_ENABLED = 'false'
-LOG_LOCATION = str(lp_folder)
-AWS_REGION = 'us-east-2'
+#local globals, the paths are built by _init_paths() on first use instead of at import.
+lp_folder = None
+config_filepath = None
+settings_cache_filepath = None
+pip_credentials_filepath = None
 
-#Dictionary storing all configuration of global settings.
+#Dictionary storing all configuration of global settings, 'value' is initialized to the default used if config file does not exist.
+#Log_Location defaults to lp_folder, filled in by _init_paths().
 settings_dict = {
-    "Environment" : {'section':'Global','name': "Environment", 'value': ENVIRONMENT, 'alias':['env','environment'], 'allowed_values': ['prod', 'test']},
-    "AWS_Region" : {'section':'Global','name': "AWS_Region", 'value': AWS_REGION, 'alias':['aws', 'aws_region', 'region'], 'allowed_values': ['us-east-2','us-east-1','us-west-1','us-west-2']},
-    "Log_File_Enabled" : {'section':'Logging','name': "Log_File_Enabled", 'value': LOG_FILE_ENABLED, 'alias':['log_file_enabled','log_enabled'], 'allowed_values': ['true','false']},
-    "Log_Location" : {'section':'Logging','name': "Log_Location", 'value': LOG_LOCATION, 'alias':['log_file','log_location'], 'allowed_values': ['valid_path()_location_only']},
-    "Logger_Level" : {'section':'Logging','name': "Logger_Level", 'value': LOGGER_LEVEL, 'alias':['logger_level', 'log_level'], 'allowed_values': ['notset', 'debug', 'info', 'warn', 'error', 'critical']}
+    "Environment" : {'section':'Global','name': "Environment", 'value': 'test', 'alias':('env','environment'), 'allowed_values': ('prod', 'test')},
+    "AWS_Region" : {'section':'Global','name': "AWS_Region", 'value': 'us-east-2', 'alias':('aws', 'aws_region', 'region'), 'allowed_values': ('us-east-2','us-east-1','us-west-1','us-west-2')},
+    "Log_File_Enabled" : {'section':'Logging','name': "Log_File_Enabled", 'value': 'false', 'alias':('log_file_enabled','log_enabled'), 'allowed_values': ('true','false')},
+    "Log_Location" : {'section':'Logging','name': "Log_Location", 'value': None, 'alias':('log_file','log_location'), 'allowed_values': ('valid_path()_location_only',)},
+    "Logger_Level" : {'section':'Logging','name': "Logger_Level", 'value': 'debug', 'alias':('logger_level', 'log_level'), 'allowed_values': ('notset', 'debug', 'info', 'warn', 'error', 'critical')}
     }
 
+def _validate_path(new_value:str) -> str:
+    """Validator for Log_Location, returns the path as typed if it is an existing folder"""
+    if not os.path.isdir(new_value):
+        raise ValueError(f'{new_value} is not a valid path. Please provide a valid path.')
+    return new_value
+
+
+def _allowed_values_validator(setting_key:str, allowed_values:tuple):
+    """Build a validator for a setting with a fixed list of values, returns the lowercased value if it is allowed"""
+    allowed_values_set = frozenset(allowed_values)
+    def validate(new_value:str) -> str:
+        new_value_lower = new_value.lower()
+        if new_value_lower not in allowed_values_set:
+            raise ValueError(f'Supported {setting_key} values: {allowed_values}')
+        return new_value_lower
+    return validate
+
+
+#Lookups built once from settings_dict: alias -> setting key, section -> setting keys, and each setting's validator.
+#A validator returns the value to store or raises ValueError with the message to show the user.
+_ALIAS_INDEX = {alias: setting_key for setting_key, setting in settings_dict.items() for alias in setting['alias']}
+_ALL_ALIASES = [setting['alias'] for setting in settings_dict.values()] #Only shown when an invalid setting name is entered
+_SECTIONS_BY_NAME = {}
+for _setting_key, _setting in settings_dict.items():
+    _SECTIONS_BY_NAME.setdefault(_setting['section'], []).append(_setting_key)
+    #Log_Location is validated with os.path.isdir, its allowed_values entry is only a placeholder
+    if _setting_key == 'Log_Location':
+        _setting['validate'] = _validate_path
+    else:
+        _setting['validate'] = _allowed_values_validator(_setting_key, _setting['allowed_values'])
+del _setting_key, _setting
+
+
+#settings.ini is only [section] headers and key = value lines, so two bytes regexes parse it without building a ConfigParser.
+_SECTION_RE = re.compile(rb'^\[([^\]]+)\][^\S\n]*$', re.M)
+_KV_RE = re.compile(rb'^([^=;#\[\s][^=\n]*?)[^\S\n]*=[^\S\n]*(.*?)[^\S\n]*$', re.M)
+
+def _fast_ini_parse(data) -> dict:
+    """Parse ini bytes (or an mmap of them) into {section: {key: value}}. Keys are lowercased like ConfigParser stores them.
+
+    Only the matched names and values are decoded. No interpolation, multiline values or ':' delimiters, which settings.ini never uses.
+    """
+    parsed = {}
+    sections = list(_SECTION_RE.finditer(data))
+    for index, section in enumerate(sections):
+        section_end = sections[index + 1].start() if index + 1 < len(sections) else len(data)
+        parsed[section.group(1).decode('utf-8')] = {
+            key.decode('utf-8').lower(): value.decode('utf-8') for key, value in _KV_RE.findall(data, section.end(), section_end)
+        }
+    return parsed
+
+
+def _parse_ini(path: str, size: int) -> dict:
+    """Read and parse an ini file of the given size in bytes"""
+    if size == 0:
+        return {} #mmap can not map an empty file
+    #Run the regexes straight over the mapped file instead of reading and decoding it into a str first, the regexes treat \r\n line endings the same as \n
+    with open(path, 'rb') as config_file, mmap.mmap(config_file.fileno(), 0, access=mmap.ACCESS_READ) as config_map:
+        return _fast_ini_parse(config_map)
+
+
+#settings.cache.json holds the same values as settings.ini keyed by setting name. settings.ini stays the file users edit, the sidecar only skips the ini parse while it is newer.
+if orjson is not None:
+    _cache_dumps, _cache_loads = orjson.dumps, orjson.loads
+else:
+    _cache_dumps, _cache_loads = (lambda obj: json.dumps(obj).encode('utf-8')), json.loads
+
+
+def _read_settings_sidecar(config_stat: os.stat_result) -> dict:
+    """Return the settings from settings.cache.json if it is at least as new as settings.ini and has every setting, otherwise None"""
+    try:
+        if settings_cache_filepath.stat().st_mtime_ns < config_stat.st_mtime_ns:
+            return None #settings.ini was edited after the sidecar was written
+        cached = _cache_loads(settings_cache_filepath.read_bytes())
+    except (OSError, ValueError):
+        return None
+    if not isinstance(cached, dict) or not all(isinstance(cached.get(setting), str) for setting in settings_dict):
+        return None
+    return cached
+
+
+def _write_settings_sidecar() -> None:
+    """Save the current settings to settings.cache.json, a failed write only means the next load parses settings.ini"""
+    try:
+        settings_cache_filepath.write_bytes(_cache_dumps({setting: settings_dict[setting]['value'] for setting in settings_dict}))
+    except OSError as write_error:
+        logger.debug(f"Could not write {settings_cache_filepath}: {write_error}")
+
 
 def __configparse_get_cache() -> bool:
     """Private function to get environment stored on disk
@@ -47,93 +141,196 @@ def __configparse_get_cache() -> bool:
     Return true if the file exists in proper format
     return false if file missing or invalid format
     """
-    global ENVIRONMENT, LOGGER_LEVEL, AWS_REGION, LOG_LOCATION, LOG_FILE_ENABLED
-
-    config = ConfigParser()
-    if not config_filepath.exists():
+    try:
+        config_stat = config_filepath.stat()
+    except FileNotFoundError:
         print(f"Could not find cached environment file at {config_filepath}")
         return False
-    config.read(config_filepath)
+    cached = _read_settings_sidecar(config_stat)
+    if cached is not None:
+        for setting in settings_dict:
+            settings_dict[setting]['value'] = cached[setting]
+        return True
+    parsed = _parse_ini(str(config_filepath), config_stat.st_size)
 
     for setting in settings_dict:
-        if config.has_option(settings_dict[setting]['section'], settings_dict[setting]['name']):
-            settings_dict[setting]['value'] = config.get(settings_dict[setting]['section'], settings_dict[setting]['name'])
+        value = parsed.get(settings_dict[setting]['section'], {}).get(settings_dict[setting]['name'].lower())
+        if value is not None:
+            settings_dict[setting]['value'] = value
         else:
             print(f"Invalid {settings_dict[setting]['name']} config setting found at {config_filepath}.")
             return False
-
-    #Assign the globals values from cache
-    ENVIRONMENT = settings_dict['Environment']['value']
-    LOGGER_LEVEL = settings_dict['Logger_Level']['value']
-    LOG_FILE_ENABLED = settings_dict['Log_File_Enabled']['value']
-    LOG_LOCATION = settings_dict['Log_Location']['value']
-    AWS_REGION = settings_dict['AWS_Region']['value']
+    _write_settings_sidecar() #Regenerate the sidecar so the next load skips the ini parse
     return True #Successfully imported settings file
 
 
+#blake2b digest of the last settings.ini text written, so saving unchanged values does not touch the disk.
+_LAST_WRITE_HASH = None
+
+
 def __configparse_cache():
     """Private function to save settings to disk"""
-    lp_folder.mkdir(exist_ok=True)
-    config = ConfigParser()
+    global _LAST_WRITE_HASH
+    #settings.ini has a fixed layout, so build the text directly in the format ConfigParser.write used: lowercased keys and a blank line after each section
+    config_text = ''.join(
+        f'[{section}]\n' + ''.join(f"{settings_dict[setting_key]['name'].lower()} = {settings_dict[setting_key]['value']}\n" for setting_key in setting_keys) + '\n'
+        for section, setting_keys in _SECTIONS_BY_NAME.items()
+    )
+    config_hash = hashlib.blake2b(config_text.encode('utf-8'), digest_size=8).digest()
+    if config_hash == _LAST_WRITE_HASH and config_filepath.exists():
+        return
 
-    #If the section does not exist, create it
     print('\nCaching new global setting values')
-    for key, value in settings_dict.items():
-        if not config.has_section(value['section']):
-            config.add_section(value['section'])
-        config.set(value['section'], value['name'], value['value']) #Create the setting file
+    lp_folder.mkdir(exist_ok=True)
+    config_filepath.write_text(config_text, encoding='utf-8')
+    _LAST_WRITE_HASH = config_hash
+    _write_settings_sidecar() #Written after settings.ini so its mtime is not older
+
+
+#Callbacks run as callback(setting_key, new_value) after set_global_setting changes a setting, for modules that apply a setting once instead of reading it through the accessors.
+_ON_CHANGE = []
 
-    #Save config file
-    with open(config_filepath, 'w', encoding='utf-8') as configfile:
-        config.write(configfile)
+
+def on_setting_change(callback) -> None:
+    '''Register callback(setting_key, new_value) to be called after set_global_setting changes a setting.'''
+    _ON_CHANGE.append(callback)
 
 
 def set_global_setting(setting_name:str, new_value:str) -> None:
-    '''Update the value of a global setting. Exits after updating to ensure global propagates'''
-    valid_aliases = []
-    for setting in settings_dict:
-        #check to see if a valid global name entered
-        if setting_name in settings_dict[setting]['alias']:
-            if new_value.lower() in settings_dict[setting]['allowed_values'] and setting_name.lower() != 'log_location':
-                settings_dict[setting]['value']=new_value.lower()
-                __configparse_cache()
-                print('Exiting session to force new setting values to all modules')
-                sys.exit()
-            elif setting_name.lower() == 'log_location':
-                if os.path.isdir(new_value):
-                    settings_dict[setting]['value']=new_value.lower()
-                    __configparse_cache()
-                    print('Exiting session to force new setting values to all modules')
-                    sys.exit()
-                else:
-                    print(f'{new_value} is not a valid path. Please provide a valid path.')
-                    return
-            else:
-                print(f'Supported {setting} values: {settings_dict[setting]["allowed_values"]}')
-                return
-        valid_aliases.append(settings_dict[setting]['alias'])
+    '''Update the value of a global setting, save it to settings.ini and notify on_setting_change callbacks.
+    The accessors return the new value immediately, no restart needed.'''
+    _ensure_loaded()
+    setting_key = _ALIAS_INDEX.get(setting_name.lower())
+    if setting_key is None:
+        #Valid global name was not entered
+        print(f'\n{setting_name} is not a valid setting name. Valid setting are: {_ALL_ALIASES}')
+        return
+
+    setting = settings_dict[setting_key]
+    try:
+        validated_value = setting['validate'](new_value)
+    except ValueError as invalid_value:
+        print(invalid_value)
+        return
+    if validated_value == setting['value']:
+        print(f'{setting_key} is already set to {validated_value}')
+        return
+    setting['value'] = validated_value
+    __configparse_cache()
+    print(f'{setting_key} set to {validated_value}')
+    for callback in _ON_CHANGE:
+        callback(setting_key, validated_value)
 
-    #Valid global name was not entered
-    print(f'\n{setting_name} is not a valid setting name. Valid setting are: {valid_aliases}')
 
+#.netrc body letting pip authenticate to artifactory, the password line is the service account API key.
+_NETRC_TEMPLATE = 'machine toolshealth.jfrog.io\nlogin pypi-user\n'
 
-def __create_pip_update_credentials():
+
+def __create_pip_update_credentials(artifactory_serviceaccount_pw:str = None):
     '''Creates .netrc file for autoupdating legopython from artifactory.
     Used when publishing a pip internally if module is used at a secure workplace.
+    Does nothing if the .netrc file already exists.
 
     #https://pip.pypa.io/en/stable/topics/authentication/'''
+    _init_paths()
     #artifactory_serviceaccount_pw = lp_secretsmanager.get_secret_v2(secret_name='pypi-artifactory-token')
-    with open('.netrc', 'w', newline='', encoding='utf-8') as newfile:
-        newfile.write('machine toolshealth.jfrog.io\n')
-        newfile.write('login pypi-user\n')
-        #newfile.write(f'password {artifactory_serviceaccount_pw}') #value needs to be API key
+    netrc = _NETRC_TEMPLATE
+    if artifactory_serviceaccount_pw:
+        netrc += f'password {artifactory_serviceaccount_pw}\n' #value needs to be API key
+    #O_EXCL skips an existing file without an exists() race, 0o600 because netrc refuses (and pip ignores) a password file other users can read
+    try:
+        netrc_fd = os.open(pip_credentials_filepath, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    except FileExistsError:
+        return
+    with os.fdopen(netrc_fd, 'wb') as netrc_file:
+        netrc_file.write(netrc.encode('utf-8'))
 
 
-#Settings file ran to initialize settings file to globals.
-if __configparse_get_cache():
-    logger.info(f"Successfully loaded file from {config_filepath}")
-    logger.debug(f"{config_filepath} loaded: ENVIRONMENT={ENVIRONMENT}, LOG_FILE_ENABLED={LOG_FILE_ENABLED}, LOGGER_LEVEL={LOGGER_LEVEL}, LOG_LOCATION={LOG_LOCATION}")
-else:
-    #If settings file did not load, initialize/overwrite setting file with defaults.
-    logger.debug(f"{config_filepath} created with defaults: ENVIRONMENT={ENVIRONMENT}, LOG_FILE_ENABLED={LOG_FILE_ENABLED}, LOGGER_LEVEL={LOGGER_LEVEL}, AWS_REGION={AWS_REGION}")
-    __configparse_cache()
+#settings.ini is read on first use instead of at import.
+_loaded = False
+_loading = False #True while the loading thread is inside _ensure_loaded, so a setting read from a log record it emits does not start a second load
+_load_lock = threading.RLock()
+#Callbacks run once after settings.ini is first loaded, for modules that configure themselves from settings (lp_logging handlers).
+_ON_LOAD = []
+
+
+def on_settings_load(callback) -> None:
+    '''Register callback() to run once settings are first loaded, or right away if they already are.'''
+    with _load_lock:
+        if not _loaded:
+            _ON_LOAD.append(callback)
+            return
+    callback()
+
+
+def _init_paths() -> None:
+    """Private function to build the settings and .netrc paths and the Log_Location default the first time they are needed"""
+    global lp_folder, config_filepath, settings_cache_filepath, pip_credentials_filepath
+    if lp_folder is not None:
+        return
+    home = Path.home()
+    config_filepath = home / ".lp" / "settings.ini"
+    settings_cache_filepath = home / ".lp" / "settings.cache.json"
+    pip_credentials_filepath = home / ".netrc"
+    if settings_dict['Log_Location']['value'] is None:
+        settings_dict['Log_Location']['value'] = str(home / ".lp")
+    lp_folder = home / ".lp" #Assigned last, it marks the paths as built
+
+
+def _ensure_loaded() -> None:
+    """Private function to initialize the settings file to globals the first time a setting is used"""
+    global _loaded, _loading
+    if _loaded:
+        return
+    with _load_lock:
+        #Other threads wait on the lock, a reentrant call from the loading thread returns with the values read so far
+        if _loaded or _loading:
+            return
+        _loading = True
+        try:
+            _init_paths()
+            if __configparse_get_cache():
+                logger.info(f"Successfully loaded file from {config_filepath}")
+                logger.debug(f"{config_filepath} loaded: ENVIRONMENT={settings_dict['Environment']['value']}, LOG_FILE_ENABLED={settings_dict['Log_File_Enabled']['value']}, LOGGER_LEVEL={settings_dict['Logger_Level']['value']}, LOG_LOCATION={settings_dict['Log_Location']['value']}")
+            else:
+                #If settings file did not load, initialize/overwrite setting file with defaults.
+                logger.debug(f"{config_filepath} created with defaults: ENVIRONMENT={settings_dict['Environment']['value']}, LOG_FILE_ENABLED={settings_dict['Log_File_Enabled']['value']}, LOGGER_LEVEL={settings_dict['Logger_Level']['value']}, AWS_REGION={settings_dict['AWS_Region']['value']}")
+                __configparse_cache()
+            _loaded = True
+        finally:
+            _loading = False
+    #Outside the lock, callbacks read settings through the accessors
+    for callback in _ON_LOAD:
+        callback()
+    _ON_LOAD.clear()
+
+
+def get_setting(setting_name:str) -> str:
+    """Return the current value of a global setting by its settings_dict key or alias, loading settings.ini on first use"""
+    _ensure_loaded()
+    return settings_dict[_ALIAS_INDEX.get(setting_name.lower(), setting_name)]['value']
+
+
+def environment() -> str:
+    """Return the Environment setting, ex) 'test' or 'prod'"""
+    return get_setting('Environment')
+
+
+def logger_level() -> str:
+    """Return the Logger_Level setting, ex) 'debug'"""
+    return get_setting('Logger_Level')
+
+
+def log_file_enabled() -> str:
+    """Return the Log_File_Enabled setting as the string 'true' or 'false'"""
+    return get_setting('Log_File_Enabled')
+
+
+def log_location() -> str:
+    """Return the Log_Location setting, the folder the log file is written to"""
+    return get_setting('Log_Location')
+
+
+def aws_region() -> str:
+    """Return the AWS_Region setting, ex) 'us-east-2'"""
+    return get_setting('AWS_Region')
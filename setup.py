@@ -21,6 +21,7 @@ requires = [
     'credstash',
     'psycopg2-binary',
     'requests',
+    'aiohttp',
     'pandas',
     'numpy',
     'configparser'